@@ -9,6 +9,8 @@
 import time
 import amqpav
 
+from concurrent.futures import as_completed
+
 
 def print_result(info):
     
@@ -35,6 +37,16 @@ def main():
     avc.get_result_async(msg_id, print_result)
     # wait max 10 seconds
     time.sleep(10)
+    print('')
+
+    # futures
+    print('# Futures')
+    futures = [avc.submit_file(name) for name in ('eicar', 'avclient.py')]
+    for future in as_completed(futures):
+
+        print('{}: is clean: {}'.format(future.msg_id, future.result()))
+
+    avc.close()
 
 
 if __name__ == '__main__':
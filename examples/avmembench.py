@@ -0,0 +1,314 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# avmembench.py
+#
+# Memory per in-flight message benchmark, fails over budget
+#
+
+import argparse
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+from kombu import Connection
+
+import amqpav
+
+
+class MemoryBudgetException(Exception):
+    pass
+
+
+class BenchmarkException(Exception):
+    pass
+
+
+class MemoryProbeReceiver(amqpav.AVReceiver):
+    '''Receiver with scanner stand-in holding scans until released.'''
+
+    def __init__(self, **kwargs):
+
+        super_init = amqpav.AVReceiver.__init__
+        super_init(self, **kwargs)
+
+        self.release = threading.Event()
+
+    def av_check(self, data):
+
+        if hasattr(data, 'read'):
+
+            data.read()
+
+        self.release.wait()
+
+        return None
+
+
+def wait_for(condition, thread, deadline, what):
+    '''Wait until condition is true.
+
+    Raises:
+        BenchmarkException: Receiver thread ended or deadline passed
+    '''
+
+    while not condition():
+
+        if not thread.is_alive():
+
+            raise BenchmarkException('receiver ended: {}'.format(what))
+
+        if time.time() >= deadline:
+
+            raise BenchmarkException('timeout: {}'.format(what))
+
+        time.sleep(0.01)
+
+
+def measure_size_memory(size, count, timeout=60.0):
+    '''Return in-flight, peak and retained memory for payload size.
+
+    Raises:
+        BenchmarkException: Receiver did not process messages
+            in timeout seconds
+    '''
+
+    # distinct payloads, no coalescing
+    payloads = [os.urandom(size) for _ in range(count)]
+
+    receiver = MemoryProbeReceiver(
+        amqp_url='memory://',
+        verbose=False,
+        poll_timeout=0.01,
+        workers=count,
+        adaptive=False,
+        prefetch=count)
+
+    started = tracemalloc.is_tracing()
+    if not started:
+
+        tracemalloc.start()
+
+    gc.collect()
+    base = tracemalloc.get_traced_memory()[0]
+    if hasattr(tracemalloc, 'reset_peak'):
+
+        tracemalloc.reset_peak()
+
+    with Connection('memory://') as conn:
+
+        receiver.avq(conn.channel()).declare()
+        producer = conn.Producer()
+
+        for payload in payloads:
+
+            message = amqpav.AVMessageRequest(
+                msg_id=str(uuid.uuid4()),
+                content_type='application/octet-stream',
+                data=payload,
+            )
+            producer.publish(
+                message.body(),
+                exchange=receiver.inex,
+                headers=message.headers(),
+                **message.properties()
+            )
+
+    thread = threading.Thread(target=receiver.run)
+    thread.daemon = True
+    thread.start()
+
+    deadline = time.time() + timeout
+    try:
+
+        wait_for(
+            lambda: receiver.running >= count,
+            thread,
+            deadline,
+            'scans of size {} not started'.format(size))
+
+        gc.collect()
+        inflight = tracemalloc.get_traced_memory()[0] - base
+
+        receiver.release.set()
+        wait_for(
+            lambda: receiver.histograms['reply_publish'].total >= count,
+            thread,
+            deadline,
+            'replies of size {} not sent'.format(size))
+
+    except BenchmarkException:
+
+        if not started:
+
+            tracemalloc.stop()
+
+        raise
+
+    finally:
+
+        receiver.release.set()
+        receiver.stop()
+        thread.join(timeout)
+
+    del receiver
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+
+    if not started:
+
+        tracemalloc.stop()
+
+    return inflight, peak - base, current - base
+
+
+def measure_message_memory(sizes, count=20, timeout=60.0):
+    '''Measure receiver memory per in-flight message with tracemalloc.
+
+    Messages go through memory:// broker to a receiver whose scans wait
+    until all messages are in flight. Memory is relative to the state
+    before publishing, so the broker copy of the body is included.
+
+    Args:
+        sizes (list): Payload sizes in bytes
+        count (int): Number of in-flight messages per size
+        timeout (float): Maximal time in seconds for one size
+
+    Return:
+        list: Report for every size
+    '''
+
+    # first run loads modules and fills caches
+    measure_size_memory(1024, 1, timeout)
+
+    reports = []
+    for size in sizes:
+
+        inflight, peak, retained = measure_size_memory(size, count, timeout)
+
+        per_message = inflight / float(count)
+        reports.append({
+            'size': size,
+            'count': count,
+            'inflight_per_message': per_message,
+            'amplification': per_message / max(size, 1),
+            'peak_per_message': peak / float(count),
+            'peak_amplification': peak / float(count * max(size, 1)),
+            'retained_per_message': retained / float(count),
+        })
+
+    return reports
+
+
+def check_memory_budget(
+        reports,
+        max_amplification=3.0,
+        max_overhead=32 * 1024,
+        max_retained=16 * 1024,
+        max_peak_amplification=4.0):
+    '''Check memory reports against budget.
+
+    In-flight memory per message may be max_amplification times payload
+    size plus fixed max_overhead for message objects. Peak memory uses
+    the same overhead with max_peak_amplification.
+
+    Args:
+        reports (list): Reports from measure_message_memory
+        max_amplification (float): Maximal in-flight memory to size ratio
+        max_overhead (int): Fixed in-flight bytes per message
+        max_retained (int): Maximal retained bytes per processed message
+        max_peak_amplification (float): Maximal peak memory to size ratio
+
+    Raises:
+        MemoryBudgetException: Budget is exceeded
+    '''
+
+    for report in reports:
+
+        budget = max_amplification * report['size'] + max_overhead
+        if report['inflight_per_message'] > budget:
+
+            raise MemoryBudgetException(
+                'size {}: in-flight {:.0f} B > {:.0f} B'.format(
+                    report['size'],
+                    report['inflight_per_message'],
+                    budget))
+
+        peak_budget = (
+            max_peak_amplification * report['size'] + max_overhead)
+        if report['peak_per_message'] > peak_budget:
+
+            raise MemoryBudgetException(
+                'size {}: peak {:.0f} B > {:.0f} B'.format(
+                    report['size'],
+                    report['peak_per_message'],
+                    peak_budget))
+
+        if report['retained_per_message'] > max_retained:
+
+            raise MemoryBudgetException(
+                'size {}: retained {:.0f} B > {} B'.format(
+                    report['size'],
+                    report['retained_per_message'],
+                    max_retained))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='AV memory benchmark')
+    parser.add_argument(
+        '--sizes', default='1024,65536,1048576,8388608',
+        help='comma separated payload sizes')
+    parser.add_argument('--count', type=int, default=20)
+    parser.add_argument('--max-amplification', type=float, default=3.0)
+    parser.add_argument('--max-overhead', type=int, default=32 * 1024)
+    parser.add_argument('--max-retained', type=int, default=16 * 1024)
+    parser.add_argument('--max-peak-amplification', type=float, default=4.0)
+    parser.add_argument(
+        '--timeout', type=float, default=60.0,
+        help='maximal time in seconds for one size')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    try:
+
+        reports = measure_message_memory(
+            sizes, count=args.count, timeout=args.timeout)
+
+    except BenchmarkException as e:
+
+        print('Benchmark failed: {}'.format(e))
+        sys.exit(1)
+
+    print('{:>10} {:>14} {:>8} {:>8} {:>10}'.format(
+        'size', 'in-flight/msg', 'ampl', 'peak', 'retained'))
+    for report in reports:
+
+        print('{size:>10} {inflight_per_message:>14.0f} '
+              '{amplification:>8.2f} {peak_amplification:>8.2f} '
+              '{retained_per_message:>10.0f}'.format(**report))
+
+    try:
+
+        check_memory_budget(
+            reports,
+            max_amplification=args.max_amplification,
+            max_overhead=args.max_overhead,
+            max_retained=args.max_retained,
+            max_peak_amplification=args.max_peak_amplification)
+
+    except MemoryBudgetException as e:
+
+        print('Memory budget exceeded: {}'.format(e))
+        sys.exit(1)
+
+    print('Memory budget OK.')
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# avreplay.py
+#
+# Traffic capture and replay tool for capacity planning
+#
+
+import argparse
+import json
+
+import amqpav
+
+
+def record(args):
+
+    recorder = amqpav.TrafficRecorder(
+        amqp_url=args.url,
+        filename=args.capture,
+        payload_dir=args.payloads)
+    print('Recording...')
+
+    try:
+
+        count = recorder.run(duration=args.duration, max_messages=args.count)
+
+    except KeyboardInterrupt:
+
+        count = recorder.count
+
+    print('Recorded: {}'.format(count))
+
+
+def replay(args):
+
+    records = amqpav.load_capture(args.capture)
+
+    claim_store = None
+    if args.claims:
+
+        claim_store = amqpav.FileClaimCheckStore(args.claims)
+
+    replayer = amqpav.TrafficReplayer(
+        records,
+        amqp_url=args.url,
+        payload_dir=args.payloads,
+        claim_store=claim_store)
+
+    if args.saturate:
+
+        rates = [float(rate) for rate in args.saturate.split(',')]
+        rate, steps = replayer.find_saturation(
+            rates,
+            step_duration=args.duration or 10.0,
+            max_p99=args.max_p99)
+
+        for step_rate, report in steps:
+
+            print('Rate {}: {}'.format(step_rate, json.dumps(report)))
+
+        print('Saturation point: {}'.format(rate))
+
+    else:
+
+        report = replayer.replay(
+            speed=args.speed,
+            rate=args.rate,
+            duration=args.duration)
+
+        print(json.dumps(report, indent=4))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='AV traffic replay')
+    parser.add_argument('--url', default='memory://', help='broker URL')
+    parser.add_argument('--capture', default='capture.jsonl')
+    parser.add_argument('--payloads', default=None, help='payload directory')
+    parser.add_argument('--duration', type=float, default=None)
+    subparsers = parser.add_subparsers()
+
+    record_parser = subparsers.add_parser('record')
+    record_parser.add_argument('--count', type=int, default=None)
+    record_parser.set_defaults(func=record)
+
+    replay_parser = subparsers.add_parser('replay')
+    replay_parser.add_argument('--speed', type=float, default=1.0)
+    replay_parser.add_argument('--rate', type=float, default=None)
+    replay_parser.add_argument(
+        '--saturate', default=None, help='comma separated rates')
+    replay_parser.add_argument('--max-p99', type=float, default=1.0)
+    replay_parser.add_argument(
+        '--claims', default=None, help='claim-check storage directory')
+    replay_parser.set_defaults(func=replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+
+    main()
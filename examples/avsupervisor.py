@@ -0,0 +1,35 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# avsupervisor.py
+#
+# Anti-virus service with multiple worker processes
+#
+
+import amqpav
+
+'''AVSupervisor usage example.'''
+
+
+def main():
+
+    print('AV Supervisor')
+    print('-' * 13)
+
+    supervisor = amqpav.AVSupervisor(
+        min_workers=1,
+        max_workers=4)
+    print('Listening...')
+
+    try:
+
+        supervisor.run()
+
+    except KeyboardInterrupt:
+
+        print('Stopped.')
+
+
+if __name__ == '__main__':
+
+    main()